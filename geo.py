@@ -0,0 +1,21 @@
+import math
+from typing import List
+import numpy as np
+
+# Średni promień Ziemi w km
+EARTH_RADIUS_KM = 6371.0088
+
+def haversine_km_array(lats: np.ndarray, lons: np.ndarray, lat0: float, lon0: float) -> np.ndarray:
+    # Odległości (haversine) wielu punktów od (lat0, lon0) w jednym wyrażeniu
+    lats = np.radians(lats)
+    lons = np.radians(lons)
+    lat0, lon0 = math.radians(lat0), math.radians(lon0)
+    a = np.sin((lats - lat0) / 2) ** 2 + math.cos(lat0) * np.cos(lats) * np.sin((lons - lon0) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def in_range_mask(coords: List[tuple], center: tuple, max_km: float) -> np.ndarray:
+    # True dla punktów (lat, lon) w zasięgu max_km od center
+    count = len(coords)
+    lats = np.fromiter((lat for lat, _ in coords), dtype=np.float64, count=count)
+    lons = np.fromiter((lon for _, lon in coords), dtype=np.float64, count=count)
+    return haversine_km_array(lats, lons, *center) <= max_km
@@ -0,0 +1,33 @@
+import asyncio
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import aiohttp
+from aiolimiter import AsyncLimiter
+from tenacity import (retry, retry_if_exception_type, retry_if_result,
+                      stop_after_attempt, wait_exponential_jitter)
+
+# Statusy HTTP, po których warto ponowić zapytanie
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Maksymalnie 5 zapytań na sekundę do jednego hosta
+REQUESTS_PER_SECOND = 5
+
+_limiters: Dict[str, AsyncLimiter] = {}
+
+def get_limiter(host: str) -> AsyncLimiter:
+    if host not in _limiters:
+        _limiters[host] = AsyncLimiter(REQUESTS_PER_SECOND, 1)
+    return _limiters[host]
+
+@retry(
+    stop=stop_after_attempt(4),
+    wait=wait_exponential_jitter(initial=1, max=10),
+    retry=retry_if_exception_type((aiohttp.ClientError, asyncio.TimeoutError))
+          | retry_if_result(lambda result: result[0] in RETRY_STATUSES),
+    # Po ostatniej próbie zwróć jej wynik (status) albo rzuć jej wyjątek
+    retry_error_callback=lambda retry_state: retry_state.outcome.result()
+)
+async def fetch(session: aiohttp.ClientSession, url: str, params: Optional[dict] = None) -> Tuple[int, bytes]:
+    async with get_limiter(urlsplit(url).hostname):
+        async with session.get(url, params=params) as response:
+            return response.status, await response.read()
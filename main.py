@@ -2,18 +2,23 @@ from fastapi import FastAPI, HTTPException, Query
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, FileResponse
 import asyncio
+import contextlib
+import functools
 import aiohttp
-from bs4 import BeautifulSoup
+from selectolax.parser import HTMLParser
 import asyncpg
 import os
+from collections import OrderedDict
 from datetime import datetime, timedelta
-import re
-from typing import List, Optional, Dict
+from typing import AsyncIterator, List, Optional, Dict, Tuple
 import json
-from geopy.distance import geodesic
 from geopy.geocoders import Nominatim
+from geopy.extra.rate_limiter import RateLimiter
 import logging
 from ticketmaster import TicketmasterScraper
+import numpy as np
+from geo import in_range_mask
+from http_client import fetch
 
 # Konfiguracja logowania
 logging.basicConfig(level=logging.INFO)
@@ -25,6 +30,18 @@ app = FastAPI(title="Music Events Agent", description="Agent dla eventów muzyki
 WROCLAW_COORDS = (51.1079, 17.0385)
 MAX_DISTANCE_KM = 6000
 
+# Maksymalna liczba równoległych zapytań do jednego źródła
+MAX_CONCURRENT_REQUESTS = 5
+
+# Liczba eventów zapisywanych do bazy jednym poleceniem COPY
+SAVE_BATCH_SIZE = 500
+
+# Selektory CSS elementów na stronach Eventim
+CARD_SELECTOR = 'article.event-listing, div.product-group-item'
+TITLE_SELECTOR = 'h1, h2, h3, h4'
+DATE_SELECTOR = 'time[datetime]'
+LOCATION_SELECTOR = '[data-qa="venue-city"]'
+
 # Lista monitorowanych artystów
 TARGET_ARTISTS = ["Debby Friday", "Gorgon City", "Rivo", "Lynnic", "Tiësto", "Fisher", 
                   "David Guetta", "Lost Frequencies", "Disclosure", 
@@ -38,122 +55,178 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is required")
 
+def create_http_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=50,
+        limit_per_host=10,
+        ttl_dns_cache=300,
+        keepalive_timeout=30
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers={
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        },
+        timeout=aiohttp.ClientTimeout(total=30)
+    )
+
+# Geokodowanie miast (wspólne dla wszystkich instancji scrapera)
+GEOCODE_CACHE_TTL = timedelta(days=90)
+GEOCODE_MEMORY_CACHE_SIZE = 4096
+geolocator = Nominatim(user_agent="music-events-agent")
+# Nominatim pozwala na 1 zapytanie/s; limiter jest bezpieczny dla wątków.
+# Błędy są przekazywane dalej, żeby nie wyglądały jak "miasto nie znalezione"
+geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1, swallow_exceptions=False)
+
+# Udane wyniki geokodowania (miasto -> (współrzędne, czas)) w kolejności LRU
+_geocode_cache: "OrderedDict[str, Tuple[tuple, datetime]]" = OrderedDict()
+# Trwające geokodowania - równoległe zapytania o to samo miasto czekają na jedno
+_geocode_inflight: Dict[str, asyncio.Task] = {}
+
+def normalize_city(city_name: str) -> str:
+    return city_name.strip().lower()
+
+def _geocode_nominatim(city_key: str) -> Optional[tuple]:
+    location = geocode(city_key)
+    if location:
+        return (location.latitude, location.longitude)
+    return None
+
+async def _geocode_lookup(city_key: str) -> Optional[tuple]:
+    try:
+        # Najpierw trwały cache w bazie, dopiero potem Nominatim
+        async with get_db_connection() as conn:
+            row = await conn.fetchrow(
+                "SELECT lat, lon FROM geocode_cache WHERE city = $1 AND ts > $2",
+                city_key, datetime.now() - GEOCODE_CACHE_TTL
+            )
+        if row:
+            return (row['lat'], row['lon'])
+        
+        # Blokujące zapytanie HTTP w osobnym wątku, żeby nie wstrzymywać pętli zdarzeń
+        coords = await asyncio.to_thread(_geocode_nominatim, city_key)
+        if coords:
+            async with get_db_connection() as conn:
+                await conn.execute(
+                    '''
+                    INSERT INTO geocode_cache (city, lat, lon, ts) VALUES ($1, $2, $3, $4)
+                    ON CONFLICT (city) DO UPDATE SET lat = EXCLUDED.lat, lon = EXCLUDED.lon, ts = EXCLUDED.ts
+                    ''',
+                    city_key, coords[0], coords[1], datetime.now()
+                )
+        return coords
+    except Exception as e:
+        logger.error(f"Błąd geokodowania dla {city_key}: {e}")
+        return None
+
+def _geocode_done(city_key: str, task: asyncio.Task):
+    _geocode_inflight.pop(city_key, None)
+    # Zapamiętujemy tylko udane wyniki; błąd, brak wyniku lub anulowanie
+    # oznacza ponowną próbę przy następnym zapytaniu
+    if task.cancelled() or task.exception() is not None or task.result() is None:
+        return
+    _geocode_cache[city_key] = (task.result(), datetime.now())
+    _geocode_cache.move_to_end(city_key)
+    if len(_geocode_cache) > GEOCODE_MEMORY_CACHE_SIZE:
+        _geocode_cache.popitem(last=False)
+
+async def _geocode(city_key: str) -> Optional[tuple]:
+    cached = _geocode_cache.get(city_key)
+    if cached and datetime.now() - cached[1] < GEOCODE_CACHE_TTL:
+        _geocode_cache.move_to_end(city_key)
+        return cached[0]
+    
+    task = _geocode_inflight.get(city_key)
+    if task is None:
+        task = asyncio.create_task(_geocode_lookup(city_key))
+        _geocode_inflight[city_key] = task
+        task.add_done_callback(functools.partial(_geocode_done, city_key))
+    # shield: anulowanie jednego oczekującego nie przerywa geokodowania pozostałym
+    return await asyncio.shield(task)
+
 class EventScraper:
-    def __init__(self):
-        self.geolocator = Nominatim(user_agent="music-events-agent")
-        self.session = None
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None):
+        self.session = session
+        self._owns_session = session is None
+        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
     
     async def get_session(self):
         if not self.session:
-            self.session = aiohttp.ClientSession(
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                },
-                timeout=aiohttp.ClientTimeout(total=30)
-            )
+            self.session = create_http_session()
         return self.session
     
     async def close_session(self):
-        if self.session:
+        # Współdzielona sesja jest zamykana przy wyłączaniu aplikacji
+        if self.session and self._owns_session:
             await self.session.close()
             self.session = None
     
-    def get_city_coordinates(self, city_name: str) -> Optional[tuple]:
-        try:
-            location = self.geolocator.geocode(city_name)
-            if location:
-                return (location.latitude, location.longitude)
-        except Exception as e:
-            logger.error(f"Błąd geokodowania dla {city_name}: {e}")
-        return None
+    def scrape_eventim_pl(self) -> AsyncIterator[Dict]:
+        return self._scrape_eventim("https://www.eventim.pl", 'eventim.pl')
     
-    def is_within_range(self, city_coords: tuple) -> bool:
-        try:
-            distance = geodesic(WROCLAW_COORDS, city_coords).kilometers
-            return distance <= MAX_DISTANCE_KM
-        except Exception:
-            return False
+    def scrape_eventim_de(self) -> AsyncIterator[Dict]:
+        return self._scrape_eventim("https://www.eventim.de", 'eventim.de')
     
-    async def scrape_eventim_pl(self) -> List[Dict]:
-        events = []
+    async def _scrape_eventim(self, base_url: str, source: str) -> AsyncIterator[Dict]:
         session = await self.get_session()
         
-        for artist in TARGET_ARTISTS:
+        async def _fetch_artist(artist: str) -> List[Dict]:
+            events = []
+            search_url = f"{base_url}/search/?term={artist.replace(' ', '+')}"
             try:
-                search_url = f"https://www.eventim.pl/search/?term={artist.replace(' ', '+')}"
-                async with session.get(search_url) as response:
-                    if response.status == 200:
-                        html = await response.text()
-                        soup = BeautifulSoup(html, 'html.parser')
-                        
-                        # Parsing eventów z Eventim.pl
-                        event_elements = soup.find_all(['div', 'article'], class_=re.compile(r'event|item|card'))
-                        
-                        for element in event_elements[:5]:  # Maksymalnie 5 eventów na artystę
-                            event_data = self.parse_eventim_event(element, artist, 'eventim.pl')
-                            if event_data:
-                                events.append(event_data)
+                async with self.semaphore:
+                    status, html = await fetch(session, search_url)
+                if status != 200:
+                    return events
                 
-                await asyncio.sleep(1)  # Rate limiting
-            except Exception as e:
-                logger.error(f"Błąd scraping Eventim.pl dla {artist}: {e}")
-        
-        return events
-    
-    async def scrape_eventim_de(self) -> List[Dict]:
-        events = []
-        session = await self.get_session()
-        
-        for artist in TARGET_ARTISTS:
-            try:
-                search_url = f"https://www.eventim.de/search/?term={artist.replace(' ', '+')}"
-                async with session.get(search_url) as response:
-                    if response.status == 200:
-                        html = await response.text()
-                        soup = BeautifulSoup(html, 'html.parser')
-                        
-                        event_elements = soup.find_all(['div', 'article'], class_=re.compile(r'event|item|card'))
-                        
-                        for element in event_elements[:5]:
-                            event_data = self.parse_eventim_event(element, artist, 'eventim.de')
-                            if event_data:
-                                events.append(event_data)
+                tree = HTMLParser(html)
+                
+                # Parsing eventów z Eventim
+                event_elements = tree.css(CARD_SELECTOR)
                 
-                await asyncio.sleep(1)
+                for element in event_elements[:5]:  # Maksymalnie 5 eventów na artystę
+                    event_data = self.parse_eventim_event(element, artist, source)
+                    if event_data:
+                        events.append(event_data)
             except Exception as e:
-                logger.error(f"Błąd scraping Eventim.de dla {artist}: {e}")
+                logger.error(f"Błąd scraping {source} dla {artist}: {e}")
+            return events
         
-        return events
+        # Eventy przekazywane dalej, gdy tylko dany artysta zostanie pobrany
+        tasks = [asyncio.ensure_future(_fetch_artist(artist)) for artist in TARGET_ARTISTS]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                for event in await next_done:
+                    yield event
+        finally:
+            # Przerwany generator nie może zostawić działających zadań
+            for task in tasks:
+                task.cancel()
     
     def parse_eventim_event(self, element, artist: str, source: str) -> Optional[Dict]:
         try:
             # Tytuł wydarzenia
-            title_elem = element.find(['h1', 'h2', 'h3', 'h4'], class_=re.compile(r'title|name|heading'))
-            title = title_elem.get_text(strip=True) if title_elem else f"{artist} - Event"
+            title_elem = element.css_first(TITLE_SELECTOR)
+            title = title_elem.text(strip=True) if title_elem else f"{artist} - Event"
             
             # Data
-            date_elem = element.find(['time', 'span', 'div'], class_=re.compile(r'date|time'))
-            date_str = date_elem.get_text(strip=True) if date_elem else ""
+            date_elem = element.css_first(DATE_SELECTOR)
+            date_str = (date_elem.attributes.get('datetime') or "") if date_elem else ""
             
             # Miasto
-            location_elem = element.find(['span', 'div'], class_=re.compile(r'location|venue|city'))
-            location = location_elem.get_text(strip=True) if location_elem else "Unknown"
+            location_elem = element.css_first(LOCATION_SELECTOR)
+            location = location_elem.text(strip=True) if location_elem else "Unknown"
             
             # Link do biletu
-            link_elem = element.find('a', href=True)
+            link_elem = element.css_first('a[href]')
             ticket_link = ""
             if link_elem:
-                href = link_elem['href']
+                href = link_elem.attributes.get('href') or ""
                 if href.startswith('/'):
                     ticket_link = f"https://www.{source}{href}"
                 else:
                     ticket_link = href
             
-            # Sprawdzenie czy miasto jest w zasięgu
-            city_coords = self.get_city_coordinates(location)
-            if city_coords and not self.is_within_range(city_coords):
-                return None
-            
             return {
                 'title': title,
                 'artist': artist,
@@ -161,7 +234,7 @@ class EventScraper:
                 'location': location,
                 'source': source,
                 'ticket_link': ticket_link,
-                'coordinates': city_coords,
+                'coordinates': None,  # Uzupełniane w locate_events
                 'scraped_at': datetime.now().isoformat()
             }
         
@@ -169,13 +242,91 @@ class EventScraper:
             logger.error(f"Błąd parsowania eventu: {e}")
             return None
 
+async def locate_events(events: List[Dict]) -> List[Dict]:
+    # Każde miasto geokodowane raz na cały przebieg scrapingu
+    pending = [event for event in events if not event['coordinates']]
+    unique_cities = list({normalize_city(event['location']) for event in pending} - {''})
+    results = await asyncio.gather(*[_geocode(city) for city in unique_cities])
+    coords_by_city = dict(zip(unique_cities, results))
+    
+    for event in pending:
+        event['coordinates'] = coords_by_city.get(normalize_city(event['location']))
+    
+    # Zasięg od Wrocławia sprawdzany dla wszystkich eventów z współrzędnymi naraz
+    located = [i for i, event in enumerate(events) if event['coordinates']]
+    if not located:
+        return events
+    
+    keep = np.ones(len(events), dtype=bool)
+    keep[located] = in_range_mask([events[i]['coordinates'] for i in located], WROCLAW_COORDS, MAX_DISTANCE_KM)
+    return [event for event, kept in zip(events, keep) if kept]
+
+async def save_batch(events: List[Dict]) -> int:
+    # Błąd zapisu partii nie może zatrzymać konsumenta - producenci czekają na miejsce w kolejce
+    try:
+        located = await locate_events(events)
+        await save_events_to_db(located)
+        return len(located)
+    except Exception as e:
+        logger.error(f"Błąd zapisu partii {len(events)} eventów: {e}")
+        return 0
+
+async def consume_events(queue: asyncio.Queue) -> int:
+    # Zapisuje eventy z kolejki partiami po SAVE_BATCH_SIZE; None kończy strumień
+    total = 0
+    batch = []
+    while True:
+        event = await queue.get()
+        if event is None:
+            break
+        batch.append(event)
+        if len(batch) >= SAVE_BATCH_SIZE:
+            total += await save_batch(batch)
+            batch = []
+    
+    if batch:
+        total += await save_batch(batch)
+    return total
+
 # Database functions
-async def get_db_connection():
-    return await asyncpg.connect(DATABASE_URL)
+EVENT_COLUMNS = ['title', 'artist', 'date_str', 'location', 'source', 'ticket_link',
+                 'coordinates_lat', 'coordinates_lon', 'scraped_at']
+EVENT_SELECT = "SELECT id, " + ", ".join(EVENT_COLUMNS) + " FROM events"
+
+# Naturalny klucz eventu (artysta, data, miejsce, źródło) - podstawa deduplikacji
+EVENT_KEY_SQL = "md5(coalesce(artist, '') || '|' || coalesce(date_str, '') || '|' || coalesce(location, '') || '|' || coalesce(source, ''))"
+
+# Eventy z tabeli tymczasowej trafiają do events; istniejący event dostaje nowy scraped_at
+UPSERT_EVENTS_QUERY = f'''
+    INSERT INTO events ({", ".join(EVENT_COLUMNS)})
+    SELECT DISTINCT ON ({EVENT_KEY_SQL}) {", ".join(EVENT_COLUMNS)}
+    FROM events_stage
+    ORDER BY {EVENT_KEY_SQL}, scraped_at DESC
+    ON CONFLICT (event_hash) DO UPDATE SET scraped_at = EXCLUDED.scraped_at
+'''
+
+# Stałe zapytania - jeden tekst SQL na endpoint, więc plan z cache
+# przygotowanych zapytań asyncpg pasuje do każdej kombinacji filtrów
+EVENTS_QUERY = f'''
+    {EVENT_SELECT}
+    WHERE ($1::text IS NULL OR artist ILIKE $1)
+      AND ($2::text IS NULL OR location ILIKE $2)
+    ORDER BY scraped_at DESC
+    LIMIT $3
+'''
+STATS_QUERY = '''
+    SELECT COUNT(*) AS total_events,
+           COUNT(DISTINCT artist) AS unique_artists,
+           COUNT(DISTINCT location) AS unique_locations
+    FROM events
+'''
+
+def get_db_connection():
+    # Połączenie z puli; używać jako `async with get_db_connection() as conn:`
+    return app.state.pool.acquire()
 
 async def init_database():
-    conn = await get_db_connection()
-    try:
+    async with get_db_connection() as conn:
         await conn.execute('''
             CREATE TABLE IF NOT EXISTS events (
                 id SERIAL PRIMARY KEY,
@@ -198,43 +349,109 @@ async def init_database():
             CREATE INDEX IF NOT EXISTS idx_events_scraped_at ON events(scraped_at);
         ''')
         
+        # Skrót naturalnego klucza i unikalny indeks do deduplikacji przy zapisie
+        await conn.execute(f'''
+            ALTER TABLE events ADD COLUMN IF NOT EXISTS event_hash TEXT
+                GENERATED ALWAYS AS ({EVENT_KEY_SQL}) STORED
+        ''')
+        
+        # Jednorazowa migracja: usuń istniejące duplikaty przed pierwszym utworzeniem indeksu
+        if await conn.fetchval("SELECT to_regclass('ux_events_hash') IS NULL"):
+            async with conn.transaction():
+                await conn.execute('''
+                    DELETE FROM events a USING events b
+                        WHERE a.event_hash = b.event_hash AND a.id < b.id;
+                    CREATE UNIQUE INDEX ux_events_hash ON events(event_hash);
+                ''')
+        
+        # Indeksy trigramowe dla filtrów ILIKE '%...%' w /events
+        try:
+            await conn.execute('''
+                CREATE EXTENSION IF NOT EXISTS pg_trgm;
+                CREATE INDEX IF NOT EXISTS idx_events_artist_trgm ON events USING gin (artist gin_trgm_ops);
+                CREATE INDEX IF NOT EXISTS idx_events_location_trgm ON events USING gin (location gin_trgm_ops);
+            ''')
+        except asyncpg.PostgresError as e:
+            logger.warning(f"Nie udało się utworzyć indeksów pg_trgm: {e}")
+        
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS geocode_cache (
+                city TEXT PRIMARY KEY,
+                lat FLOAT,
+                lon FLOAT
+            )
+        ''')
+        
+        # Znacznik czasu wpisu, po GEOCODE_CACHE_TTL miasto jest geokodowane ponownie
+        await conn.execute('''
+            ALTER TABLE geocode_cache ADD COLUMN IF NOT EXISTS ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ''')
+        
         logger.info("Database initialized successfully")
-    finally:
-        await conn.close()
 
 async def save_events_to_db(events: List[Dict]):
     if not events:
         return
     
-    conn = await get_db_connection()
-    try:
-        # Wyczyść stare dane (starsze niż 7 dni)
-        await conn.execute(
-            "DELETE FROM events WHERE scraped_at < $1",
-            datetime.now() - timedelta(days=7)
+    records = [
+        (
+            event['title'], event['artist'], event['date_str'], event['location'],
+            event['source'], event['ticket_link'],
+            event['coordinates'][0] if event['coordinates'] else None,
+            event['coordinates'][1] if event['coordinates'] else None,
+            datetime.fromisoformat(event['scraped_at'])
         )
-        
-        # Dodaj nowe eventy
-        for event in events:
-            coords_lat = event['coordinates'][0] if event['coordinates'] else None
-            coords_lon = event['coordinates'][1] if event['coordinates'] else None
+        for event in events
+    ]
+    
+    async with get_db_connection() as conn:
+        async with conn.transaction():
+            # Wyczyść stare dane (starsze niż 7 dni)
+            await conn.execute(
+                "DELETE FROM events WHERE scraped_at < $1",
+                datetime.now() - timedelta(days=7)
+            )
             
-            await conn.execute('''
-                INSERT INTO events (title, artist, date_str, location, source, ticket_link, 
-                                  coordinates_lat, coordinates_lon, scraped_at)
-                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
-            ''', event['title'], event['artist'], event['date_str'], event['location'],
-                event['source'], event['ticket_link'], coords_lat, coords_lon, 
-                datetime.fromisoformat(event['scraped_at']))
+            # Nowe eventy jednym poleceniem COPY do tabeli tymczasowej, potem upsert bez duplikatów
+            await conn.execute(f'''
+                CREATE TEMP TABLE events_stage ON COMMIT DROP AS
+                SELECT {", ".join(EVENT_COLUMNS)} FROM events WITH NO DATA
+            ''')
+            await conn.copy_records_to_table(
+                'events_stage',
+                records=records,
+                columns=EVENT_COLUMNS
+            )
+            await conn.execute(UPSERT_EVENTS_QUERY)
         
         logger.info(f"Saved {len(events)} events to database")
-    finally:
-        await conn.close()
 
 # API Endpoints
 @app.on_event("startup")
 async def startup_event():
+    # Jedna sesja HTTP na cały czas życia aplikacji (pula połączeń, keep-alive)
+    app.state.http_session = create_http_session()
+    app.state.pool = await asyncpg.create_pool(
+        DATABASE_URL,
+        min_size=5,
+        max_size=20,
+        max_inactive_connection_lifetime=300,
+        command_timeout=60,
+        statement_cache_size=1024
+    )
     await init_database()
+    
+    # Wstępne pobranie attractionId artystów z Ticketmaster (w tle)
+    tm_scraper = TicketmasterScraper(session=app.state.http_session)
+    app.state.tm_warmup = asyncio.create_task(tm_scraper.resolve_attractions(TARGET_ARTISTS))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Rozgrzewka nie może działać na zamkniętej sesji HTTP
+    app.state.tm_warmup.cancel()
+    await asyncio.gather(app.state.tm_warmup, return_exceptions=True)
+    await app.state.http_session.close()
+    await app.state.pool.close()
 
 @app.get("/")
 async def root():
@@ -246,23 +463,13 @@ async def get_events(
     location: Optional[str] = Query(None, description="Filter by location"),
     limit: int = Query(50, le=100)
 ):
-    conn = await get_db_connection()
-    try:
-        query = "SELECT * FROM events WHERE 1=1"
-        params = []
-        
-        if artist:
-            query += " AND LOWER(artist) LIKE LOWER($" + str(len(params) + 1) + ")"
-            params.append(f"%{artist}%")
-        
-        if location:
-            query += " AND LOWER(location) LIKE LOWER($" + str(len(params) + 1) + ")"
-            params.append(f"%{location}%")
-        
-        query += " ORDER BY scraped_at DESC LIMIT $" + str(len(params) + 1)
-        params.append(limit)
-        
-        rows = await conn.fetch(query, *params)
+    async with get_db_connection() as conn:
+        rows = await conn.fetch(
+            EVENTS_QUERY,
+            f"%{artist}%" if artist else None,
+            f"%{location}%" if location else None,
+            limit
+        )
         
         events = []
         for row in rows:
@@ -279,9 +486,6 @@ async def get_events(
             })
         
         return {"events": events, "total": len(events)}
-    
-    finally:
-        await conn.close()
 
 @app.get("/artists")
 async def get_artists():
@@ -289,46 +493,55 @@ async def get_artists():
 
 @app.get("/stats")
 async def get_stats():
-    conn = await get_db_connection()
-    try:
-        total_events = await conn.fetchval("SELECT COUNT(*) FROM events")
-        unique_artists = await conn.fetchval("SELECT COUNT(DISTINCT artist) FROM events")
-        unique_locations = await conn.fetchval("SELECT COUNT(DISTINCT location) FROM events")
+    async with get_db_connection() as conn:
+        stats = await conn.fetchrow(STATS_QUERY)
         
         return {
-            "total_events": total_events,
-            "unique_artists": unique_artists,
-            "unique_locations": unique_locations,
+            "total_events": stats['total_events'],
+            "unique_artists": stats['unique_artists'],
+            "unique_locations": stats['unique_locations'],
             "monitored_artists": len(TARGET_ARTISTS)
         }
-    finally:
-        await conn.close()
 
 @app.post("/scrape")
 async def manual_scrape():
-    scraper = EventScraper()
+    scraper = EventScraper(session=app.state.http_session)
     try:
         logger.info("Starting manual scrape...")
         
-        # Scraping z różnych źródeł
-        eventim_pl_events = await scraper.scrape_eventim_pl()
-        eventim_de_events = await scraper.scrape_eventim_de()
+        # Scraping z różnych źródeł (równolegle), zapis do bazy w trakcie pobierania
+        tm_scraper = TicketmasterScraper(session=app.state.http_session)
+        queue = asyncio.Queue(maxsize=SAVE_BATCH_SIZE * 2)
+        consumer = asyncio.create_task(consume_events(queue))
         
-        # Scraping z Ticketmaster
-        tm_scraper = TicketmasterScraper()
-        ticketmaster_events = await tm_scraper.scrape_events(TARGET_ARTISTS)
+        async def produce(events: AsyncIterator[Dict]):
+            # aclosing: anulowany producent zamyka też generator (i jego zadania)
+            async with contextlib.aclosing(events):
+                async for event in events:
+                    await queue.put(event)
         
-        all_events = eventim_pl_events + eventim_de_events + ticketmaster_events
+        try:
+            # Błąd jednego źródła anuluje pozostałych producentów
+            async with asyncio.TaskGroup() as producers:
+                producers.create_task(produce(scraper.scrape_eventim_pl()))
+                producers.create_task(produce(scraper.scrape_eventim_de()))
+                producers.create_task(produce(tm_scraper.scrape_events(TARGET_ARTISTS)))
+        except BaseException:
+            consumer.cancel()
+            await asyncio.gather(consumer, return_exceptions=True)
+            raise
         
-        # Zapisz do bazy danych
-        await save_events_to_db(all_events)
+        await queue.put(None)
+        total_events = await consumer
         
         return {
             "message": "Scraping completed successfully",
-            "total_events_found": len(all_events)
+            "total_events_found": total_events
         }
         
     except Exception as e:
+        if isinstance(e, ExceptionGroup):
+            e = e.exceptions[0]
         logger.error(f"Error during scraping: {e}")
         return {
             "message": f"Scraping failed: {str(e)}",
@@ -341,7 +554,7 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(app, host="0.0.0.0", port=port, loop="uvloop", http="httptools")
 
 
 
@@ -1,30 +1,144 @@
 import os
+import logging
+import asyncio
 import aiohttp
+import orjson
 from datetime import datetime
-from typing import List, Dict, Optional
-from geopy.distance import geodesic
+from typing import AsyncIterator, List, Dict, Optional
+import numpy as np
+from geo import in_range_mask
+from http_client import fetch
+
+logger = logging.getLogger(__name__)
 
 # Współrzędne Wrocławia jako punkt centralny
 WROCLAW_COORDS = (51.1079, 17.0385)
 MAX_DISTANCE_KM = 700
 
+# Maksymalna liczba równoległych zapytań do API
+MAX_CONCURRENT_REQUESTS = 5
+
+# Maksymalny rozmiar strony w Discovery API
+PAGE_SIZE = 200
+
+# Cache nazwa artysty -> attractionId (None gdy API nie zna artysty o tej nazwie)
+ATTRACTION_IDS: Dict[str, Optional[str]] = {}
+# Trwające wyszukiwania attractionId - rozgrzewka przy starcie i /scrape czekają na to samo zadanie
+_attraction_inflight: Dict[str, asyncio.Task] = {}
+
+class AttractionLookupError(Exception):
+    pass
+
 class TicketmasterScraper:
-    def __init__(self):
+    def __init__(self, session: aiohttp.ClientSession):
+        self.session = session
         self.api_key = os.getenv("TM_API_KEY")
         self.base_url = "https://app.ticketmaster.com/discovery/v2/events"
+        self.attractions_url = "https://app.ticketmaster.com/discovery/v2/attractions"
+        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
         
-    async def scrape_events(self, artists: List[str]) -> List[Dict]:
+    async def scrape_events(self, artists: List[str]) -> AsyncIterator[Dict]:
         if not self.api_key:
-            return []
+            return
+        
+        await self.resolve_attractions(artists)
+        artists_by_id = {ATTRACTION_IDS[artist]: artist for artist in artists if ATTRACTION_IDS.get(artist)}
+        unresolved = [artist for artist in artists if not ATTRACTION_IDS.get(artist)]
+        
+        # Artyści bez attractionId - wyszukiwanie po słowie kluczowym
+        async def _fetch_artist(artist: str) -> List[Dict]:
+            async with self.semaphore:
+                return await self.search_artist_events(self.session, artist)
+        
+        tasks = [asyncio.ensure_future(_fetch_artist(artist)) for artist in unresolved]
+        
+        try:
+            # Wszyscy znani artyści w jednym (stronicowanym) zapytaniu
+            if artists_by_id:
+                async for event in self.search_attraction_events(artists_by_id):
+                    yield event
             
-        all_events = []
+            for next_done in asyncio.as_completed(tasks):
+                for event in await next_done:
+                    yield event
+        finally:
+            # Przerwany generator nie może zostawić działających zadań
+            for task in tasks:
+                task.cancel()
+    
+    async def resolve_attractions(self, artists: List[str]):
+        if not self.api_key:
+            return
         
-        async with aiohttp.ClientSession() as session:
-            for artist in artists:
-                events = await self.search_artist_events(session, artist)
-                all_events.extend(events)
-                
-        return all_events
+        tasks = [self._attraction_task(artist) for artist in artists if artist not in ATTRACTION_IDS]
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def _attraction_task(self, artist: str) -> asyncio.Task:
+        task = _attraction_inflight.get(artist)
+        if task is None:
+            task = asyncio.create_task(self._resolve_attraction(artist))
+            _attraction_inflight[artist] = task
+            task.add_done_callback(lambda _: _attraction_inflight.pop(artist, None))
+        return task
+    
+    async def _resolve_attraction(self, artist: str):
+        try:
+            async with self.semaphore:
+                ATTRACTION_IDS[artist] = await self.search_attraction_id(artist)
+        except Exception as e:
+            # Nieudane zapytanie nie trafia do cache - kolejny scraping spróbuje ponownie
+            logger.error("Error resolving attraction for %s: %s", artist, e)
+    
+    async def search_attraction_id(self, artist: str) -> Optional[str]:
+        # None tylko dla poprawnej odpowiedzi bez dokładnego dopasowania nazwy;
+        # nieudane zapytanie rzuca wyjątek
+        params = {
+            "apikey": self.api_key,
+            "keyword": artist,
+            "classificationName": "Music",
+            "size": 20
+        }
+        
+        status, body = await fetch(self.session, self.attractions_url, params)
+        if status != 200:
+            raise AttractionLookupError(f"API returned status {status}")
+        data = orjson.loads(body)
+        
+        # Tylko dokładne dopasowanie nazwy; w innym razie wyszukiwanie po słowie kluczowym
+        for attraction in data.get("_embedded", {}).get("attractions", []):
+            if (attraction.get("name") or "").casefold() == artist.casefold():
+                return attraction.get("id")
+        return None
+    
+    async def search_attraction_events(self, artists_by_id: Dict[str, str]) -> AsyncIterator[Dict]:
+        params = {
+            "apikey": self.api_key,
+            "attractionId": ",".join(artists_by_id),
+            "size": PAGE_SIZE,
+            "countryCode": "PL,DE,CZ,SK",
+            "classificationName": "Music",
+            "sort": "date,asc"
+        }
+        
+        page = 0
+        total_pages = 1
+        
+        while page < total_pages:
+            try:
+                async with self.semaphore:
+                    status, body = await fetch(self.session, self.base_url, {**params, "page": page})
+                if status != 200:
+                    logger.warning("API returned status %s for attractions page %s", status, page)
+                    break
+                data = orjson.loads(body)
+            except Exception as e:
+                logger.error("Error fetching attraction events page %s: %s", page, e)
+                break
+            
+            for event in self.parse_attraction_events(data, artists_by_id):
+                yield event
+            total_pages = data.get("page", {}).get("totalPages", 0)
+            page += 1
     
     async def search_artist_events(self, session: aiohttp.ClientSession, artist: str) -> List[Dict]:
         params = {
@@ -37,15 +151,15 @@ class TicketmasterScraper:
         }
         
         try:
-            async with session.get(self.base_url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    print(f"DEBUG: Found {len(data.get('_embedded', {}).get('events', []))} events for {artist}")
-                    return self.parse_events(data, artist)
-                else:
-                    print(f"DEBUG: API returned status {response.status} for {artist}")
+            status, body = await fetch(session, self.base_url, params)
+            if status == 200:
+                data = orjson.loads(body)
+                logger.debug("Found %s events for %s", len(data.get('_embedded', {}).get('events', [])), artist)
+                return self.parse_events(data, artist)
+            else:
+                logger.warning("API returned status %s for %s", status, artist)
         except Exception as e:
-            print(f"Error fetching events for {artist}: {e}")
+            logger.error("Error fetching events for %s: %s", artist, e)
             
         return []
     
@@ -56,61 +170,80 @@ class TicketmasterScraper:
             return events
             
         for event in data["_embedded"]["events"]:
-            try:
-                # Podstawowe informacje o evencie
-                name = event.get("name", "")
-                url = event.get("url", "")
-                
-                # Data
-                dates = event.get("dates", {}).get("start", {})
-                date_str = dates.get("localDate", "")
+            event_data = self.parse_event(event, artist)
+            if event_data:
+                events.append(event_data)
+        
+        return self.filter_by_distance(events)
+    
+    def parse_attraction_events(self, data: dict, artists_by_id: Dict[str, str]) -> List[Dict]:
+        events = []
+        
+        if "_embedded" not in data or "events" not in data["_embedded"]:
+            return events
+        
+        for event in data["_embedded"]["events"]:
+            # Przypisz event do każdego monitorowanego artysty z listy wykonawców
+            for attraction in event.get("_embedded", {}).get("attractions", []):
+                artist = artists_by_id.get(attraction.get("id"))
+                if artist:
+                    event_data = self.parse_event(event, artist)
+                    if event_data:
+                        events.append(event_data)
+        
+        return self.filter_by_distance(events)
+    
+    def parse_event(self, event: dict, artist: str) -> Optional[Dict]:
+        try:
+            # Podstawowe informacje o evencie
+            name = event.get("name", "")
+            url = event.get("url", "")
+            
+            # Data
+            dates = event.get("dates", {}).get("start", {})
+            date_str = dates.get("localDate", "")
+            
+            # Venue i lokalizacja
+            venues = event.get("_embedded", {}).get("venues", [])
+            coordinates = None
+            if venues:
+                venue = venues[0]
+                city = venue.get("city", {}).get("name", "")
+                country = venue.get("country", {}).get("countryCode", "")
+                location = f"{city}, {country}"
                 
-                # Venue i lokalizacja
-                venues = event.get("_embedded", {}).get("venues", [])
-                if venues:
-                    venue = venues[0]
-                    city = venue.get("city", {}).get("name", "")
-                    country = venue.get("country", {}).get("countryCode", "")
-                    location = f"{city}, {country}"
+                if venue.get("location"):
+                    lat = float(venue["location"].get("latitude", 0))
+                    lon = float(venue["location"].get("longitude", 0))
                     
-                    # Sprawdź odległość od Wrocławia
-                    if venue.get("location"):
-                        lat = float(venue["location"].get("latitude", 0))
-                        lon = float(venue["location"].get("longitude", 0))
-                        
-                        if lat and lon:
-                            distance = geodesic(WROCLAW_COORDS, (lat, lon)).kilometers
-                            print(f"DEBUG: {city} distance: {distance}km")
-                            if distance > MAX_DISTANCE_KM:
-                                print(f"DEBUG: Skipping {city} - too far ({distance}km)")
-                                continue
-                            
-                            coordinates = (lat, lon)
-                        else:
-                            coordinates = None
-                    else:
-                        coordinates = None
-                else:
-                    location = "Unknown"
-                    coordinates = None
-                
-                events.append({
-                    "title": name,
-                    "artist": artist,
-                    "date_str": date_str,
-                    "location": location,
-                    "source": "ticketmaster",
-                    "ticket_link": url,
-                    "coordinates": coordinates,
-                    "scraped_at": datetime.now().isoformat()
-                })
-                
-            except Exception as e:
-                print(f"Error parsing event: {e}")
-                continue
-                
-
-        return events
-
-
-
+                    if lat and lon:
+                        coordinates = (lat, lon)
+            else:
+                location = "Unknown"
+            
+            return {
+                "title": name,
+                "artist": artist,
+                "date_str": date_str,
+                "location": location,
+                "source": "ticketmaster",
+                "ticket_link": url,
+                "coordinates": coordinates,
+                "scraped_at": datetime.now().isoformat()
+            }
+            
+        except Exception as e:
+            logger.error("Error parsing event: %s", e)
+            return None
+    
+    def filter_by_distance(self, events: List[Dict]) -> List[Dict]:
+        # Sprawdź odległość od Wrocławia dla wszystkich eventów naraz
+        located = [i for i, event in enumerate(events) if event["coordinates"]]
+        if not located:
+            return events
+        
+        keep = np.ones(len(events), dtype=bool)
+        keep[located] = in_range_mask([events[i]["coordinates"] for i in located], WROCLAW_COORDS, MAX_DISTANCE_KM)
+        logger.debug("Skipping %s events - too far", len(events) - int(keep.sum()))
+        
+        return [event for event, kept in zip(events, keep) if kept]